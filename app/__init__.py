@@ -1,8 +1,18 @@
+import logging
+import click
 from flask import Flask, g
 from app.config import Config
-from app.database import Base, engine, get_db_connection
+from app.database import Base, engine, SessionLocal
 from app.api_keys.entity import ApiKey
-from app.predictions.ecg_model import ECGModel
+from app.api_keys.email_service import EmailService
+from app.api_keys.key_filter import active_key_filter
+from app.api_keys.migrations import migrate_raw_keys_to_hashes
+from app.json_provider import OrjsonProvider
+from app.logging_config import setup_logging
+from app.predictions.ecg_model import ECGModel, configure_torch_threads
+
+
+logger = logging.getLogger(__name__)
 
 
 def create_app(config_class=Config):
@@ -11,36 +21,95 @@ def create_app(config_class=Config):
     
     This is the main application factory that:
     - Loads configuration
+    - Configures logging
     - Sets up database connection
+    - Registers CLI commands (schema creation)
+    - Creates shared services (email, ECG model)
     - Registers blueprints (API routes)
     - Initializes ML models
     """
     app = Flask(__name__)
     app.config.from_object(config_class)
+    setup_logging(app.config['LOG_LEVEL'])
+    
+    # Parse request bodies and encode jsonify() responses with orjson
+    app.json = OrjsonProvider(app)
     
-    # Database connection setup - inject db session into request context
+    # Database session setup - inject pooled db session into request context
     @app.before_request
     def before_request():
-        g.db = get_db_connection()
+        g.db = SessionLocal()
     
     @app.teardown_request
     def teardown_request(exception=None):
-        db = g.pop('db', None)
-        if db is not None:
-            db.close()
+        g.pop('db', None)
+        # Return the connection to the pool and discard the thread-local session
+        SessionLocal.remove()
     
-    # Create database tables
-    with app.app_context():
+    # Create database tables on demand: `python manage.py init-schema`
+    @app.cli.command('init-schema')
+    def init_schema():
+        """Create the database tables"""
         Base.metadata.create_all(bind=engine)
         print("✅ Database tables created")
     
-    # Load ECG model
+    # Hash the raw API keys of a database created before keys were hashed:
+    # `python manage.py migrate-api-key-hashes` (needs API_KEY_HASH_SECRET)
+    @app.cli.command('migrate-api-key-hashes')
+    def migrate_api_key_hashes():
+        """Replace stored raw API keys with their hashes"""
+        with engine.begin() as conn:
+            migrated = migrate_raw_keys_to_hashes(conn)
+        if migrated is None:
+            print("✅ No legacy api_keys table; nothing to migrate")
+        else:
+            print(f"✅ Migrated {migrated} API keys to hashed storage")
+    
+    # Export the loaded ECG model for ONNX Runtime: `python manage.py export-onnx [PATH]`
+    @app.cli.command('export-onnx')
+    @click.argument('path', required=False)
+    def export_onnx(path):
+        """Export the ECG model to ONNX (defaults to ECG_ONNX_PATH)"""
+        path = path or app.config['ECG_ONNX_PATH']
+        if not path:
+            raise click.UsageError("Pass a PATH or set ECG_ONNX_PATH")
+        app.extensions['ecg_model'].export_onnx(path)
+        print(f"✅ ECG model exported to {path}")
+    
+    # Build the active API key filter so unknown keys are rejected in memory
+    db = SessionLocal()
+    try:
+        active_key_filter.load(db)
+    except Exception as e:
+        logger.warning("Could not load active API key filter - %s", e)
+    finally:
+        SessionLocal.remove()
+    
+    # Shared email service (keeps its SMTP connection and template cache warm)
+    app.extensions['email_service'] = EmailService(
+        smtp_host=app.config['SMTP_HOST'],
+        smtp_port=app.config['SMTP_PORT'],
+        smtp_user=app.config['SMTP_USER'],
+        smtp_password=app.config['SMTP_PASSWORD'],
+        sender_email=app.config['SENDER_EMAIL']
+    )
+    
+    # Load ECG model and share the instance with the predictions endpoint
+    configure_torch_threads(app.config['TORCH_NUM_THREADS'])
+    ecg_model = ECGModel()
+    app.extensions['ecg_model'] = ecg_model
     try:
-        ecg_model = ECGModel()
-        ecg_model.load(app.config['ECG_MODEL_PATH'])
+        ecg_model.load(
+            app.config['ECG_MODEL_PATH'],
+            max_batch_size=app.config['ECG_MAX_BATCH_SIZE'],
+            quantize=app.config['ECG_QUANTIZE'],
+            bf16=app.config['ECG_BF16'],
+            onnx_path=app.config['ECG_ONNX_PATH']
+        )
     except Exception as e:
-        print(f"⚠️  Warning: Could not load ECG model - {str(e)}")
-        print("   Predictions endpoint will not work until model is loaded")
+        logger.warning(
+            "Could not load ECG model - %s. Predictions endpoint will not work until model is loaded", e
+        )
     
     # Register blueprints
     from app.api_keys import api_keys_bp
@@ -1,9 +1,21 @@
 """Authentication and authorization decorators"""
 from functools import wraps
-from flask import request, jsonify, g
+import orjson
+from flask import request, g
 from app.api_keys.service import ApiKeyService
 
 
+def _static_error(message: str, status: int) -> tuple:
+    """Encode a fixed JSON error once, as a (body, status, headers) response tuple"""
+    return orjson.dumps({"error": message}), status, {"Content-Type": "application/json"}
+
+
+# Tuples rather than shared Response objects: Flask builds a fresh Response
+# from them per request, so after-request hooks cannot leak state between requests
+_MISSING_API_KEY = _static_error("Missing x-api-key header", 401)
+_INVALID_API_KEY = _static_error("Invalid or inactive API key", 401)
+
+
 def api_key_required(f):
     """
     Decorator to require valid API key in x-api-key header
@@ -15,12 +27,12 @@ def api_key_required(f):
         api_key = request.headers.get('x-api-key')
         
         if not api_key:
-            return jsonify({"error": "Missing x-api-key header"}), 401
+            return _MISSING_API_KEY
         
         # Validate API key using service
         service = ApiKeyService(g.db)
         if not service.validate_api_key(api_key):
-            return jsonify({"error": "Invalid or inactive API key"}), 401
+            return _INVALID_API_KEY
         
         # Store validated API key in request context
         g.api_key = api_key
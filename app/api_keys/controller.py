@@ -1,6 +1,8 @@
 """API Key management endpoints"""
 import os
-from flask import Blueprint, request, jsonify, g, render_template_string
+import re
+from functools import lru_cache
+from flask import Blueprint, request, jsonify, g, render_template_string, current_app
 from app.api_keys.service import ApiKeyService
 from app.api_keys.email_service import EmailService
 from app.config import Config
@@ -8,16 +10,21 @@ from app.config import Config
 
 api_keys_bp = Blueprint('api_keys', __name__)
 
+# Basic email shape check: local part, "@", domain containing a dot
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
 
-def get_email_service():
-    """Get configured email service instance"""
-    return EmailService(
-        smtp_host=Config.SMTP_HOST,
-        smtp_port=Config.SMTP_PORT,
-        smtp_user=Config.SMTP_USER,
-        smtp_password=Config.SMTP_PASSWORD,
-        sender_email=Config.SENDER_EMAIL
-    )
+
+def get_email_service() -> EmailService:
+    """Get the application's shared email service instance"""
+    return current_app.extensions['email_service']
+
+
+@lru_cache(maxsize=1)
+def _success_template() -> str:
+    """Read the verification success page once and keep it in memory"""
+    template_path = os.path.join(os.path.dirname(__file__), 'templates', 'verification_success.html')
+    with open(template_path, 'r', encoding='utf-8') as f:
+        return f.read()
 
 
 def get_base_url():
@@ -50,7 +57,7 @@ def request_api_key():
         email = data['email'].strip().lower()
         
         # Basic email validation
-        if '@' not in email or '.' not in email:
+        if not EMAIL_RE.match(email):
             return jsonify({"error": "Invalid email format"}), 400
         
         # Check if email already has an active API key
@@ -59,7 +66,10 @@ def request_api_key():
         existing_active_key = repo.get_active_by_email(email)
         
         if existing_active_key:
-            return jsonify({"error": "Email already has an active API key. Please deactivate it first."}), 409
+            return jsonify({
+                "error": "Email already has an active API key. Please deactivate it first.",
+                "note": "If the API key email never arrived, request a deactivation, then a new key."
+            }), 409
         
         # Create verification token
         token = service.create_verification_token(email, action="generate")
@@ -68,8 +78,8 @@ def request_api_key():
         email_service = get_email_service()
         base_url = get_base_url()
         
-        if not email_service.send_verification_email(email, token, base_url, action="generate"):
-            return jsonify({"error": "Failed to send verification email"}), 500
+        # Delivered in the background (with retries)
+        email_service.send_verification_email(email, token, base_url, action="generate")
         
         return jsonify({
             "message": "Verification email sent. Please check your inbox.",
@@ -106,7 +116,7 @@ def request_api_key_deactivation():
         email = data['email'].strip().lower()
         
         # Basic email validation
-        if '@' not in email or '.' not in email:
+        if not EMAIL_RE.match(email):
             return jsonify({"error": "Invalid email format"}), 400
         
         # Check if email has an active API key
@@ -124,8 +134,8 @@ def request_api_key_deactivation():
         email_service = get_email_service()
         base_url = get_base_url()
         
-        if not email_service.send_verification_email(email, token, base_url, action="deactivate"):
-            return jsonify({"error": "Failed to send verification email"}), 500
+        # Delivered in the background (with retries)
+        email_service.send_verification_email(email, token, base_url, action="deactivate")
         
         return jsonify({
             "message": "Verification email sent. Please check your inbox.",
@@ -169,9 +179,8 @@ def verify_email():
             if error:
                 return jsonify(error), 400
             
-            # Send API key via email
-            if not email_service.send_api_key_email(email, api_key.api_key):
-                return jsonify({"error": "API key generated but failed to send email"}), 500
+            # Send API key via email (delivered in the background, with retries)
+            email_service.send_api_key_email(email, api_key)
             
         elif action == "deactivate":
             # Deactivate API key
@@ -181,15 +190,9 @@ def verify_email():
                 return jsonify(error), 400
             
             # Send deactivation confirmation email
-            if not email_service.send_deactivation_confirmation_email(email):
-                return jsonify({"error": "API key deactivated but failed to send confirmation email"}), 500
-        
-        # Load success template
-        template_path = os.path.join(os.path.dirname(__file__), 'templates', 'verification_success.html')
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template_content = f.read()
+            email_service.send_deactivation_confirmation_email(email)
         
-        return render_template_string(template_content)
+        return render_template_string(_success_template())
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
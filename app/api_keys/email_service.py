@@ -1,14 +1,33 @@
 """Email service for API Key verification and notifications"""
+import hashlib
+import logging
 import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import Optional
-from jinja2 import Template
+from cachetools import TTLCache
+from jinja2 import Environment, FileSystemLoader
 import os
 
 
+logger = logging.getLogger(__name__)
+
+# Delays (seconds) before each redelivery of a message the SMTP server did
+# not accept. Nothing is stored on disk: a message still failing after the
+# last retry, or pending when the process exits, is lost.
+RETRY_DELAYS = (10, 60, 5 * 60, 30 * 60)
+
+
 class EmailService:
-    """Handles sending emails for API key operations"""
+    """
+    Handles sending emails for API key operations
+    
+    Emails are queued and delivered in the background, so the send_*
+    methods cannot report delivery failures to the caller. Failed
+    deliveries are retried (see RETRY_DELAYS) and logged.
+    """
     
     def __init__(self, smtp_host: str, smtp_port: int, smtp_user: str, smtp_password: str, sender_email: str):
         self.smtp_host = smtp_host
@@ -16,11 +35,71 @@ class EmailService:
         self.smtp_user = smtp_user
         self.smtp_password = smtp_password
         self.sender_email = sender_email
+        
+        # Authenticated SMTP connection reused across sends (guarded by the lock)
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._smtp_lock = threading.Lock()
+        
+        # Delivery runs off the request thread; one worker matches the single
+        # persistent connection, which serializes sends anyway
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='email')
+        
+        # Digests of recently queued messages, to drop exact duplicates
+        self._recent_sends = TTLCache(maxsize=1024, ttl=60)
+        self._recent_lock = threading.Lock()
+        
+        # Templates are loaded and compiled once, then served from Jinja's cache
+        self._env = Environment(
+            loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), 'templates')),
+            auto_reload=False,
+            cache_size=-1
+        )
+    
+    def _render_template(self, template_name: str, **context) -> str:
+        """
+        Render a cached email template
+        
+        Args:
+            template_name: File name of the template in the templates folder
+            **context: Variables passed to the template
+            
+        Returns:
+            Rendered HTML
+            
+        Raises:
+            jinja2.TemplateNotFound: If the template does not exist
+        """
+        return self._env.get_template(template_name).render(**context)
+    
+    def _connect(self) -> smtplib.SMTP:
+        """Open a new SMTP connection with STARTTLS and log in"""
+        server = smtplib.SMTP(self.smtp_host, self.smtp_port)
+        server.starttls()
+        server.login(self.smtp_user, self.smtp_password)
+        return server
+    
+    def _discard_connection(self) -> None:
+        """Close the cached SMTP connection, ignoring errors. Caller must hold the lock."""
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+    
+    def close(self) -> None:
+        """Close the persistent SMTP connection, if open"""
+        with self._smtp_lock:
+            self._discard_connection()
     
     def _send_email(self, to_email: str, subject: str, html_content: str) -> bool:
         """
         Send an email with HTML content
         
+        The SMTP connection is opened (and authenticated) on first use and
+        reused for later messages; if the server has dropped it, a new one
+        is opened and the message is retried once.
+        
         Args:
             to_email: Recipient email address
             subject: Email subject
@@ -40,18 +119,67 @@ class EmailService:
             html_part = MIMEText(html_content, 'html')
             msg.attach(html_part)
             
-            # Send email
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_user, self.smtp_password)
-                server.send_message(msg)
+            # Send email over the persistent connection
+            with self._smtp_lock:
+                try:
+                    if self._smtp is None:
+                        self._smtp = self._connect()
+                    try:
+                        self._smtp.send_message(msg)
+                    except smtplib.SMTPServerDisconnected:
+                        self._smtp = self._connect()
+                        self._smtp.send_message(msg)
+                except Exception:
+                    # Connection state is unknown after a failure; start fresh next time
+                    self._discard_connection()
+                    raise
             
             return True
-        except Exception as e:
-            print(f"Error sending email: {str(e)}")
+        except Exception:
+            logger.exception("Error sending email to %s", to_email)
             return False
     
-    def send_verification_email(self, to_email: str, verification_token: str, base_url: str, action: str = "generate") -> bool:
+    def _deliver(self, to_email: str, subject: str, html_content: str, attempt: int = 0) -> None:
+        """Send a queued email on the delivery thread, scheduling a retry if it fails"""
+        if self._send_email(to_email, subject, html_content):
+            return
+        
+        if attempt < len(RETRY_DELAYS):
+            delay = RETRY_DELAYS[attempt]
+            logger.warning("Retrying email to %s in %ds (retry %d of %d)", to_email, delay, attempt + 1, len(RETRY_DELAYS))
+            # Wait on a timer rather than on the delivery thread, so other messages are not held up
+            timer = threading.Timer(
+                delay,
+                self._executor.submit,
+                args=(self._deliver, to_email, subject, html_content, attempt + 1)
+            )
+            timer.daemon = True
+            timer.start()
+        else:
+            logger.error("Giving up on email %r to %s after %d attempts", subject, to_email, attempt + 1)
+    
+    def _queue_email(self, to_email: str, subject: str, html_content: str) -> None:
+        """
+        Queue an email for background delivery
+        
+        Returns once the message is handed to the delivery thread. An
+        identical message queued within the last minute (e.g. a client
+        retry) is not sent again.
+        
+        Args:
+            to_email: Recipient email address
+            subject: Email subject
+            html_content: HTML content of the email
+        """
+        digest = hashlib.sha256(f"{to_email}\0{subject}\0{html_content}".encode()).digest()
+        with self._recent_lock:
+            if digest in self._recent_sends:
+                return
+            self._recent_sends[digest] = True
+        
+        self._executor.submit(self._deliver, to_email, subject, html_content)
+    
+    def send_verification_email(self, to_email: str, verification_token: str, base_url: str, action: str = "generate") -> None:
         """
         Send email verification link
         
@@ -60,21 +188,7 @@ class EmailService:
             verification_token: Unique verification token
             base_url: Base URL of the application
             action: Either "generate" or "deactivate"
-            
-        Returns:
-            True if email was sent successfully, False otherwise
         """
-        template_path = os.path.join(os.path.dirname(__file__), 'templates', 'email_verification.html')
-        
-        try:
-            with open(template_path, 'r', encoding='utf-8') as f:
-                template_content = f.read()
-        except FileNotFoundError:
-            print(f"Template not found: {template_path}")
-            return False
-        
-        template = Template(template_content)
-        
         # Generate verification link
         verification_link = f"{base_url}/api/v1/api-keys/verify?token={verification_token}"
         
@@ -82,7 +196,8 @@ class EmailService:
         action_text = "API Key Generation" if action == "generate" else "API Key Deactivation"
         button_text = "Verify Email" if action == "generate" else "Confirm Deactivation"
         
-        html_content = template.render(
+        html_content = self._render_template(
+            'email_verification.html',
             email=to_email,
             verification_link=verification_link,
             action_text=action_text,
@@ -91,62 +206,39 @@ class EmailService:
         
         subject = f"Heartify - {action_text} Verification"
         
-        return self._send_email(to_email, subject, html_content)
+        self._queue_email(to_email, subject, html_content)
     
-    def send_api_key_email(self, to_email: str, api_key: str) -> bool:
+    def send_api_key_email(self, to_email: str, api_key: str) -> None:
         """
         Send API key to user via email
         
+        Only the key's hash is stored, so if every delivery attempt fails the
+        key is lost. The owner recovers by deactivating it (/deactivation)
+        and requesting a new one; until then /generation answers 409.
+        
         Args:
             to_email: Recipient email address
             api_key: The generated API key
-            
-        Returns:
-            True if email was sent successfully, False otherwise
         """
-        template_path = os.path.join(os.path.dirname(__file__), 'templates', 'api_key_email.html')
-        
-        try:
-            with open(template_path, 'r', encoding='utf-8') as f:
-                template_content = f.read()
-        except FileNotFoundError:
-            print(f"Template not found: {template_path}")
-            return False
-        
-        template = Template(template_content)
-        
-        html_content = template.render(
+        html_content = self._render_template(
+            'api_key_email.html',
             email=to_email,
             api_key=api_key
         )
         
         subject = "Heartify - Your API Key"
         
-        return self._send_email(to_email, subject, html_content)
+        self._queue_email(to_email, subject, html_content)
     
-    def send_deactivation_confirmation_email(self, to_email: str) -> bool:
+    def send_deactivation_confirmation_email(self, to_email: str) -> None:
         """
         Send API key deactivation confirmation
         
         Args:
             to_email: Recipient email address
-            
-        Returns:
-            True if email was sent successfully, False otherwise
         """
-        template_path = os.path.join(os.path.dirname(__file__), 'templates', 'deactivation_email.html')
-        
-        try:
-            with open(template_path, 'r', encoding='utf-8') as f:
-                template_content = f.read()
-        except FileNotFoundError:
-            print(f"Template not found: {template_path}")
-            return False
-        
-        template = Template(template_content)
-        
-        html_content = template.render(email=to_email)
+        html_content = self._render_template('deactivation_email.html', email=to_email)
         
         subject = "Heartify - API Key Deactivated"
         
-        return self._send_email(to_email, subject, html_content)
+        self._queue_email(to_email, subject, html_content)
@@ -1,5 +1,5 @@
 """Database entity for API Keys"""
-from sqlalchemy import Column, String, Boolean, DateTime
+from sqlalchemy import Column, String, Boolean, DateTime, Index, LargeBinary
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -8,8 +8,11 @@ class ApiKey(Base):
     """
     API Key entity for managing access to protected endpoints
     
+    Only a keyed hash of the API key is stored; the raw key is shown to the
+    owner once (by email) and never persisted.
+    
     Attributes:
-        api_key: Unique API key string
+        api_key_hash: HMAC-SHA256 digest of the API key (32 raw bytes)
         email: Email address of the API key owner
         active: Whether the key is currently active
         created_at: Timestamp when the key was created
@@ -17,8 +20,20 @@ class ApiKey(Base):
     """
     __tablename__ = "api_keys"
 
-    api_key = Column(String, primary_key=True, nullable=False)
+    api_key_hash = Column(LargeBinary(32), primary_key=True, nullable=False)
     email = Column(String, nullable=False, index=True)
     active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime, default=func.now(), nullable=False)
     last_used = Column(DateTime, nullable=True)
+    
+    # Partial unique index over active rows: serves get_active_by_email and
+    # lets the database enforce at most one active key per email
+    __table_args__ = (
+        Index(
+            'ix_api_keys_email_active_true',
+            'email',
+            unique=True,
+            postgresql_where=active.is_(True),
+            sqlite_where=active.is_(True)
+        ),
+    )
@@ -0,0 +1,104 @@
+"""Cross-worker broadcast of API key invalidations over Redis pub/sub"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+import redis
+
+
+logger = logging.getLogger(__name__)
+
+# Key hashes are raw HMAC-SHA256 digests, sent back to back in one message
+_HASH_SIZE = 32
+
+
+class InvalidationListener:
+    """
+    Delivers API key invalidations published by any worker to this worker
+    
+    A background thread subscribes to the channel and hands the revoked key
+    hashes to on_invalidate. An in-process cache stays correct only while
+    that subscription is up, so callers must check is_connected() before
+    trusting it: while disconnected (Redis down, or a worker that has not
+    subscribed yet), messages may be missed. on_resubscribe is called on
+    every (re)subscription, before is_connected() turns true, so the cache
+    can be cleared of entries that a missed message would have dropped.
+    """
+    
+    def __init__(
+        self,
+        client: redis.Redis,
+        channel: str,
+        on_invalidate: Callable[[List[bytes]], None],
+        on_resubscribe: Callable[[], None],
+        retry_interval: float = 5.0
+    ):
+        self._client = client
+        self._channel = channel
+        self._on_invalidate = on_invalidate
+        self._on_resubscribe = on_resubscribe
+        self._retry_interval = retry_interval
+        self._connected = False
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+    
+    def publish(self, key_hashes: List[bytes]) -> None:
+        """Broadcast revoked key hashes to every worker (raises redis.RedisError)"""
+        if key_hashes:
+            self._client.publish(self._channel, b"".join(key_hashes))
+    
+    def is_connected(self) -> bool:
+        """Whether invalidations are currently being received by this process"""
+        self._ensure_thread()
+        return self._connected
+    
+    def _ensure_thread(self) -> None:
+        # Threads do not survive fork(), so each worker process starts its own
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._connected = False
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='api-key-invalidations', daemon=True)
+            self._thread.start()
+    
+    def _run(self) -> None:
+        was_connected = True
+        while True:
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self._channel)
+                # Wait for the subscribe confirmation before trusting the cache again
+                while pubsub.get_message(timeout=self._retry_interval, ignore_subscribe_messages=False) is None:
+                    pass
+                self._on_resubscribe()
+                self._connected = True
+                if not was_connected:
+                    logger.info("Subscribed to API key invalidations again")
+                was_connected = True
+                
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None or message['type'] != 'message':
+                        continue
+                    data = message['data']
+                    self._on_invalidate([data[i:i + _HASH_SIZE] for i in range(0, len(data), _HASH_SIZE)])
+            except Exception:
+                self._connected = False
+                if was_connected:
+                    logger.warning(
+                        "Lost API key invalidation subscription; "
+                        "in-process key cache disabled until it is back",
+                        exc_info=True
+                    )
+                was_connected = False
+                time.sleep(self._retry_interval)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
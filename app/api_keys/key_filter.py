@@ -0,0 +1,102 @@
+"""In-memory Bloom filter of active API key hashes"""
+import logging
+import os
+import threading
+import time
+from typing import Optional
+from pybloom_live import ScalableBloomFilter
+from sqlalchemy.orm import Session
+from app.api_keys.repository import ApiKeyRepository
+from app.database import SessionLocal
+
+
+logger = logging.getLogger(__name__)
+
+
+class ActiveKeyFilter:
+    """
+    Bloom filter used to reject unknown API keys without a database query
+    
+    A miss means the key hash was not active when the filter was built; a
+    hit may be a false positive and must still be confirmed against the
+    database. Each worker rebuilds its filter from the database every
+    refresh_interval seconds on a background timer, so requests never wait
+    for a rebuild. A filter that has not been rebuilt for two intervals (a
+    freshly forked worker, or a failing database) is not trusted.
+    
+    Keys issued by another worker are missing from this worker's filter
+    until the next rebuild. Callers must therefore only trust a miss for
+    keys that would otherwise have been found in the shared Redis cache,
+    where new keys are published when they are issued.
+    """
+    
+    def __init__(self, session_factory, refresh_interval: float = 30.0):
+        self._session_factory = session_factory
+        self._refresh_interval = refresh_interval
+        self._bloom: Optional[ScalableBloomFilter] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._timer_pid: Optional[int] = None
+    
+    def load(self, db: Session) -> None:
+        """Rebuild the filter from all active key hashes in the database"""
+        bloom = ScalableBloomFilter(initial_capacity=10000, error_rate=0.001)
+        for key_hash in ApiKeyRepository(db).get_active_hashes():
+            bloom.add(key_hash)
+        
+        with self._lock:
+            self._bloom = bloom
+            self._loaded_at = time.monotonic()
+    
+    def add(self, key_hash: bytes) -> None:
+        """Register a newly created active key hash"""
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(key_hash)
+    
+    def might_be_active(self, key_hash: bytes) -> bool:
+        """
+        Check whether a key hash may belong to an active key
+        
+        Args:
+            key_hash: Hash of the API key
+            
+        Returns:
+            False if the key was not active at a recent rebuild, True otherwise
+        """
+        with self._lock:
+            self._ensure_timer()
+            if self._bloom is None or time.monotonic() - self._loaded_at > 2 * self._refresh_interval:
+                # No recent filter available; defer to the database
+                return True
+            return key_hash in self._bloom
+    
+    def _ensure_timer(self) -> None:
+        # Timers do not survive fork(), so each worker process starts its own
+        # on first use. Caller must hold self._lock.
+        if self._timer is not None and self._timer_pid == os.getpid():
+            return
+        self._timer_pid = os.getpid()
+        self._schedule()
+    
+    def _schedule(self) -> None:
+        self._timer = threading.Timer(self._refresh_interval, self._run)
+        self._timer.daemon = True
+        self._timer.start()
+    
+    def _run(self) -> None:
+        db = self._session_factory()
+        try:
+            self.load(db)
+        except Exception:
+            db.rollback()
+            logger.exception("Error loading active API key filter")
+        finally:
+            db.close()
+            with self._lock:
+                self._schedule()
+
+
+# The rebuild runs outside any request, so it uses plain (non-scoped) sessions
+active_key_filter = ActiveKeyFilter(SessionLocal.session_factory)
@@ -0,0 +1,81 @@
+"""Buffered, periodically flushed last_used timestamps for API keys"""
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from app.api_keys.repository import ApiKeyRepository
+from app.database import SessionLocal
+
+
+logger = logging.getLogger(__name__)
+
+
+class LastUsedBuffer:
+    """
+    Collects last_used timestamps in memory and writes them in one batch
+    
+    last_used is informational and eventually consistent, so instead of an
+    UPDATE + COMMIT per authenticated request, the most recent use of each
+    key is kept in a dict and flushed by a background timer with a single
+    bulk UPDATE.
+    """
+    
+    def __init__(self, session_factory, interval: float = 30.0):
+        self._session_factory = session_factory
+        self._interval = interval
+        self._pending: Dict[bytes, datetime] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._timer_pid: Optional[int] = None
+    
+    def record(self, key_hash: bytes) -> None:
+        """Remember that a key was used now; written on the next flush"""
+        with self._lock:
+            self._pending[key_hash] = datetime.utcnow()
+            self._ensure_timer()
+    
+    def flush(self) -> None:
+        """Write all pending timestamps with one UPDATE statement"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        
+        if not pending:
+            return
+        
+        db = self._session_factory()
+        try:
+            ApiKeyRepository(db).bulk_update_last_used(pending)
+        except Exception:
+            db.rollback()
+            logger.exception("Error flushing API key last_used timestamps")
+        finally:
+            db.close()
+    
+    def _ensure_timer(self) -> None:
+        # Timers do not survive fork(), so each worker process starts its own
+        # on first use. Caller must hold self._lock.
+        if self._timer is not None and self._timer_pid == os.getpid():
+            return
+        self._timer_pid = os.getpid()
+        self._schedule()
+    
+    def _schedule(self) -> None:
+        self._timer = threading.Timer(self._interval, self._run)
+        self._timer.daemon = True
+        self._timer.start()
+    
+    def _run(self) -> None:
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._schedule()
+
+
+# The flusher runs outside any request, so it uses plain (non-scoped) sessions
+last_used_buffer = LastUsedBuffer(SessionLocal.session_factory)
+
+# Do not drop the last window of timestamps on a clean shutdown
+atexit.register(last_used_buffer.flush)
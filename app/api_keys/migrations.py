@@ -0,0 +1,82 @@
+"""One-off data migrations for the api_keys table"""
+from typing import Optional
+from sqlalchemy import Boolean, DateTime, String, inspect, text
+from sqlalchemy.engine import Connection
+from app.api_keys.entity import ApiKey
+from app.api_keys.service import hash_api_key
+
+
+# The legacy table is moved here while its rows are copied
+LEGACY_TABLE = "api_keys_legacy"
+
+
+def migrate_raw_keys_to_hashes(conn: Connection) -> Optional[int]:
+    """
+    Convert a legacy api_keys table (raw key as primary key) to hashed keys
+    
+    The legacy table is renamed to LEGACY_TABLE, the current table is
+    created, the rows are copied with the raw key replaced by
+    hash_api_key(key), and only then is the legacy table dropped, so no raw
+    key is left in the database. Existing keys keep working. The legacy
+    schema allowed several active keys per email; only the most recently
+    created one stays active, as the current schema enforces.
+    
+    On PostgreSQL the migration is a single transaction (run it inside
+    engine.begin()). SQLite's driver commits DDL immediately, so a failure
+    there leaves the rows in LEGACY_TABLE; running the migration again
+    resumes from it.
+    
+    Args:
+        conn: Connection with an open transaction
+    
+    Returns:
+        Number of keys migrated, or None if there is no legacy table
+    """
+    table_name = ApiKey.__tablename__
+    inspector = inspect(conn)
+    
+    if inspector.has_table(LEGACY_TABLE):
+        # Resuming an interrupted migration: the new table can only hold rows
+        # written by that attempt if it is empty
+        if inspector.has_table(table_name):
+            if conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar():
+                raise RuntimeError(
+                    f"Both {LEGACY_TABLE} and a non-empty {table_name} exist; resolve them manually"
+                )
+            conn.execute(text(f"DROP TABLE {table_name}"))
+    elif not inspector.has_table(table_name):
+        return None
+    elif 'api_key' not in {column['name'] for column in inspector.get_columns(table_name)}:
+        return None
+    else:
+        conn.execute(text(f"ALTER TABLE {table_name} RENAME TO {LEGACY_TABLE}"))
+        # Index names are not per table; free the name for the new table's index
+        conn.execute(text("DROP INDEX IF EXISTS ix_api_keys_email"))
+    
+    # Typed, so DateTime values stored as text (SQLite) come back as datetimes
+    rows = conn.execute(
+        text(
+            f"SELECT api_key, email, active, created_at, last_used FROM {LEGACY_TABLE} "
+            "ORDER BY created_at DESC"
+        ).columns(api_key=String, email=String, active=Boolean, created_at=DateTime, last_used=DateTime)
+    ).all()
+    
+    active_emails = set()
+    values = []
+    for row in rows:
+        active = bool(row.active) and row.email not in active_emails
+        if active:
+            active_emails.add(row.email)
+        values.append({
+            'api_key_hash': hash_api_key(row.api_key),
+            'email': row.email,
+            'active': active,
+            'created_at': row.created_at,
+            'last_used': row.last_used
+        })
+    
+    ApiKey.__table__.create(conn)
+    if values:
+        conn.execute(ApiKey.__table__.insert(), values)
+    conn.execute(text(f"DROP TABLE {LEGACY_TABLE}"))
+    return len(values)
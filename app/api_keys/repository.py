@@ -1,6 +1,7 @@
 """Repository layer for API Key database operations"""
+from sqlalchemy import case
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 from app.api_keys.entity import ApiKey
 
@@ -11,20 +12,9 @@ class ApiKeyRepository:
     def __init__(self, db: Session):
         self.db = db
     
-    def create(self, api_key: ApiKey) -> ApiKey:
-        """Create a new API key in database"""
-        self.db.add(api_key)
-        self.db.commit()
-        self.db.refresh(api_key)
-        return api_key
-    
-    def get_by_key(self, key: str) -> Optional[ApiKey]:
-        """Retrieve an API key by its key string"""
-        return self.db.query(ApiKey).filter(ApiKey.api_key == key).first()
-    
-    def get_by_email(self, email: str) -> List[ApiKey]:
-        """Retrieve all API keys for a given email address"""
-        return self.db.query(ApiKey).filter(ApiKey.email == email).all()
+    def get_by_hash(self, key_hash: bytes) -> Optional[ApiKey]:
+        """Retrieve an API key by the hash of its key string (primary key lookup)"""
+        return self.db.get(ApiKey, key_hash)
     
     def get_active_by_email(self, email: str) -> Optional[ApiKey]:
         """Retrieve the active API key for a given email address"""
@@ -33,25 +23,62 @@ class ApiKeyRepository:
             ApiKey.active == True
         ).first()
     
-    def update_active_status(self, key: str, active: bool) -> Optional[ApiKey]:
+    def get_active_hashes(self) -> List[bytes]:
+        """Retrieve the hashes of all active API keys"""
+        return [
+            key_hash for (key_hash,) in
+            self.db.query(ApiKey.api_key_hash).filter(ApiKey.active == True)
+        ]
+    
+    def get_active_hashes_by_email(self, email: str) -> List[bytes]:
+        """Retrieve the hashes of the active API keys for a given email address"""
+        return [
+            key_hash for (key_hash,) in
+            self.db.query(ApiKey.api_key_hash).filter(
+                ApiKey.email == email,
+                ApiKey.active == True
+            )
+        ]
+    
+    def update_active_status(self, key_hash: bytes, active: bool) -> Optional[ApiKey]:
         """Update the active status of an API key"""
-        api_key = self.get_by_key(key)
+        api_key = self.get_by_hash(key_hash)
         if api_key:
             api_key.active = active
             self.db.commit()
-            self.db.refresh(api_key)
         return api_key
     
-    def deactivate_all_for_email(self, email: str) -> None:
-        """Deactivate all API keys for a given email address"""
-        api_keys = self.get_by_email(email)
-        for api_key in api_keys:
-            api_key.active = False
-        self.db.commit()
+    def _deactivate_active_for_email(self, email: str) -> None:
+        """Deactivate an email's active API keys with a single UPDATE (not committed)"""
+        self.db.query(ApiKey).filter(
+            ApiKey.email == email,
+            ApiKey.active == True
+        ).update({ApiKey.active: False}, synchronize_session=False)
     
-    def update_last_used(self, key: str) -> None:
-        """Update the last_used timestamp for an API key"""
-        api_key = self.get_by_key(key)
-        if api_key:
-            api_key.last_used = datetime.utcnow()
+    def rotate(self, email: str, api_key: ApiKey) -> ApiKey:
+        """
+        Replace an email's active API keys with a new one in a single transaction
+        
+        The UPDATE deactivating the old keys and the INSERT of the new key
+        are committed together, with one commit instead of two.
+        """
+        try:
+            self._deactivate_active_for_email(email)
+            self.db.add(api_key)
             self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return api_key
+    
+    def bulk_update_last_used(self, last_used: Dict[bytes, datetime]) -> None:
+        """Set last_used for many API keys with a single UPDATE statement"""
+        if not last_used:
+            return
+        self.db.query(ApiKey).filter(
+            ApiKey.api_key_hash.in_(list(last_used.keys()))
+        ).update(
+            {ApiKey.last_used: case(last_used, value=ApiKey.api_key_hash)},
+            synchronize_session=False
+        )
+        self.db.commit()
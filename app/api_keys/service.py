@@ -1,22 +1,192 @@
 """Service layer for API Key business logic"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
 import secrets
+import threading
+import time
 import uuid
+from functools import cached_property
+import redis
+from cachetools import TTLCache
 from sqlalchemy.orm import Session
-from typing import Optional, Dict, Tuple
-from datetime import datetime, timedelta
+from typing import Optional, Dict, Tuple, List
 from app.api_keys.entity import ApiKey
+from app.api_keys.invalidation import InvalidationListener
+from app.api_keys.key_filter import active_key_filter
+from app.api_keys.last_used import last_used_buffer
 from app.api_keys.repository import ApiKeyRepository
+from app.config import Config
+from app.redis_client import redis_client
 
 
-# In-memory store for verification tokens (in production, use Redis or database)
-verification_tokens = {}
+logger = logging.getLogger(__name__)
+
+# Verification tokens live in Redis so they are shared by all workers and
+# expire on their own
+VERIFICATION_TOKEN_TTL = 24 * 60 * 60  # seconds
+
+
+def _verification_token_key(token: str) -> str:
+    """Redis key under which a verification token is stored"""
+    return f"api_key:verify:{token}"
+
+
+# Server-side secret used to hash API keys before they reach the database
+_API_KEY_HASH_SECRET = Config.API_KEY_HASH_SECRET.encode()
+
+# Short-lived cache of successfully validated API keys (key hash -> owner email).
+# Only active keys are cached. Deactivations are broadcast to every worker
+# over Redis pub/sub, and the cache is only used while this worker is
+# subscribed, so a deactivated key is dropped everywhere, not just here.
+_validated_keys = TTLCache(maxsize=10_000, ttl=60)
+
+_cache_lock = threading.RLock()
+
+# Bumped on every invalidation, so a validation that started before it does
+# not put the key back into the in-process cache afterwards
+_invalidation_epoch = 0
+
+# Validated keys are also cached in Redis (key hash -> owner email), shared by
+# all workers. Deactivated keys are overwritten with a revocation marker
+# rather than deleted, and validations write back with SET NX, so a
+# validation that read the key as active just before it was deactivated
+# cannot re-cache it afterwards.
+VALIDATED_KEY_TTL = 5 * 60  # seconds
+_REVOKED_MARKER = "!revoked"
+
+
+class _RedisHealth:
+    """
+    Tracks Redis failures on the API key validation path
+    
+    After an error, shared-cache reads and write-backs are skipped for
+    `backoff` seconds so requests go straight to the database instead of
+    each waiting for a timeout, and errors are logged at most once per
+    `log_interval` seconds.
+    """
+    
+    def __init__(self, backoff: float = 5.0, log_interval: float = 60.0):
+        self._backoff = backoff
+        self._log_interval = log_interval
+        self._unavailable_until = 0.0
+        self._logged_at = float('-inf')
+        self._suppressed = 0
+        self._lock = threading.Lock()
+    
+    def available(self) -> bool:
+        """Whether the shared cache should be used right now"""
+        return time.monotonic() >= self._unavailable_until
+    
+    def failed(self, message: str) -> None:
+        """Record a Redis error (call from an except block) and log it if due"""
+        now = time.monotonic()
+        with self._lock:
+            self._unavailable_until = now + self._backoff
+            if now - self._logged_at < self._log_interval:
+                self._suppressed += 1
+                return
+            suppressed, self._suppressed = self._suppressed, 0
+            self._logged_at = now
+        logger.warning(
+            "%s; using the database for %.0fs (%d similar errors suppressed)",
+            message, self._backoff, suppressed, exc_info=True
+        )
+
+
+_redis_health = _RedisHealth()
+
+
+def _drop_cached_validations(key_hashes: List[bytes]) -> None:
+    """Drop in-process cache entries for deactivated keys (any worker's)"""
+    global _invalidation_epoch
+    with _cache_lock:
+        _invalidation_epoch += 1
+        for key_hash in key_hashes:
+            _validated_keys.pop(key_hash, None)
+
+
+def _clear_cached_validations() -> None:
+    """Drop the whole in-process cache after invalidations may have been missed"""
+    global _invalidation_epoch
+    with _cache_lock:
+        _invalidation_epoch += 1
+        _validated_keys.clear()
+
+
+_invalidations = InvalidationListener(
+    redis_client,
+    "ak:invalidate",
+    on_invalidate=_drop_cached_validations,
+    on_resubscribe=_clear_cached_validations
+)
+
+
+def hash_api_key(key: str) -> bytes:
+    """Compute the raw HMAC-SHA256 digest under which an API key is stored"""
+    return hmac.new(_API_KEY_HASH_SECRET, key.encode(), hashlib.sha256).digest()
+
+
+def _validated_key_redis_key(key_hash: bytes) -> str:
+    """Redis key under which a validated API key is cached"""
+    return f"ak:{key_hash.hex()}"
+
+
+def _invalidate_cached_keys(email: str, key_hashes: List[bytes]) -> None:
+    """
+    Drop cached validations for keys that are being deactivated
+    
+    The keys are dropped from this worker's cache, marked as revoked in
+    Redis and broadcast to the other workers, which drop them from theirs.
+    
+    Args:
+        email: Owner email, for logging
+        key_hashes: Hashes of the deactivated keys
+    """
+    if not key_hashes:
+        return
+    _drop_cached_validations(key_hashes)
+    
+    # Always attempted, even while reads are backed off
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for key_hash in key_hashes:
+            pipe.set(_validated_key_redis_key(key_hash), _REVOKED_MARKER, ex=VALIDATED_KEY_TTL)
+        pipe.execute()
+        _invalidations.publish(key_hashes)
+    except redis.RedisError:
+        # Not throttled: a failed revocation leaves the key cached until VALIDATED_KEY_TTL.
+        # If Redis is down, the other workers have lost their subscription and
+        # stopped using their in-process caches anyway.
+        logger.exception("Error invalidating cached API keys for %s", email)
+
+
+def _publish_new_key(key_hash: bytes, email: str) -> None:
+    """
+    Cache a newly issued key in Redis so every worker accepts it immediately
+    
+    Other workers only learn about the key at their next Bloom filter
+    rebuild; until then validation finds it here. Always attempted, even
+    while reads are backed off.
+    """
+    try:
+        redis_client.set(_validated_key_redis_key(key_hash), email, ex=VALIDATED_KEY_TTL, nx=True)
+    except redis.RedisError:
+        logger.exception("Error publishing new API key for %s", email)
 
 
 class ApiKeyService:
     """Business logic for API key management"""
     
     def __init__(self, db: Session):
-        self.repo = ApiKeyRepository(db)
+        self.db = db
+    
+    @cached_property
+    def repo(self) -> ApiKeyRepository:
+        """Repository for this request's session, built only when a query is needed"""
+        return ApiKeyRepository(self.db)
     
     def create_verification_token(self, email: str, action: str = "generate") -> str:
         """
@@ -30,69 +200,71 @@ class ApiKeyService:
             Verification token string
         """
         token = str(uuid.uuid4())
-        verification_tokens[token] = {
-            "email": email,
-            "action": action,
-            "expires_at": datetime.utcnow() + timedelta(hours=24)
-        }
+        redis_client.setex(
+            _verification_token_key(token),
+            VERIFICATION_TOKEN_TTL,
+            json.dumps({"email": email, "action": action})
+        )
         return token
     
     def verify_token(self, token: str) -> Tuple[Optional[str], Optional[str], Optional[Dict]]:
         """
         Verify a token and get the associated email and action
         
+        The token is consumed atomically (GETDEL), so it can be used only
+        once even when the same link is opened concurrently.
+        
         Args:
             token: Verification token
             
         Returns:
             Tuple of (email, action, error_dict)
         """
-        if token not in verification_tokens:
+        # Expired tokens have already been evicted by Redis
+        raw = redis_client.getdel(_verification_token_key(token))
+        if raw is None:
             return None, None, {"error": "Invalid or expired token"}
         
-        token_data = verification_tokens[token]
-        
-        # Check if token is expired
-        if datetime.utcnow() > token_data["expires_at"]:
-            del verification_tokens[token]
-            return None, None, {"error": "Token has expired"}
+        token_data = json.loads(raw)
         
-        email = token_data["email"]
-        action = token_data["action"]
-        
-        # Remove token after verification
-        del verification_tokens[token]
-        
-        return email, action, None
+        return token_data["email"], token_data["action"], None
     
-    def generate_api_key_for_email(self, email: str) -> Tuple[Optional[ApiKey], Optional[Dict]]:
+    def generate_api_key_for_email(self, email: str) -> Tuple[Optional[str], Optional[Dict]]:
         """
         Generate a new API key for an email address
         
+        Only the hash of the key is stored, so the raw key returned here is
+        the only copy and must be delivered to the owner.
+        
         Args:
             email: Email address of the owner
             
         Returns:
-            Tuple of (ApiKey, error_dict)
+            Tuple of (raw_api_key, error_dict)
         """
-        # Deactivate all existing keys for this email (safety measure)
-        self.repo.deactivate_all_for_email(email)
+        # Existing active keys are deactivated together with the insert (safety measure)
+        previous_hashes = self.repo.get_active_hashes_by_email(email)
         
-        # Generate a secure random API key
-        new_key = secrets.token_urlsafe(32)
+        # Generate a secure random API key (32 random bytes, unpadded base64url)
+        new_key = base64.urlsafe_b64encode(secrets.token_bytes(32)).rstrip(b'=').decode()
         
         # Create ApiKey entity
+        key_hash = hash_api_key(new_key)
         api_key = ApiKey(
-            api_key=new_key,
+            api_key_hash=key_hash,
             email=email,
             active=True
         )
         
         try:
-            created_key = self.repo.create(api_key)
-            return created_key, None
+            self.repo.rotate(email, api_key)
         except Exception as e:
             return None, {"error": f"Failed to create API key: {str(e)}"}
+        
+        _invalidate_cached_keys(email, previous_hashes)
+        active_key_filter.add(key_hash)
+        _publish_new_key(key_hash, email)
+        return new_key, None
     
     def deactivate_api_key_for_email(self, email: str) -> Tuple[bool, Optional[Dict]]:
         """
@@ -110,22 +282,84 @@ class ApiKeyService:
             return False, {"error": "No active API key found for this email"}
         
         # Deactivate the key
-        self.repo.update_active_status(active_key.api_key, False)
+        self.repo.update_active_status(active_key.api_key_hash, False)
+        _invalidate_cached_keys(email, [active_key.api_key_hash])
         return True, None
     
     def validate_api_key(self, key: str) -> bool:
         """
         Validate if an API key exists and is active
         
+        Successful validations are cached for a short time, in process and
+        in Redis, so repeated requests with the same key skip the database
+        entirely. The in-process cache is bypassed while this worker is not
+        subscribed to invalidation broadcasts. Keys found neither in Redis
+        (where new keys are published when issued) nor in the active-key
+        Bloom filter are rejected without a database query; while Redis is
+        unavailable the filter is not trusted and the database decides.
+        
         Args:
             key: The API key string
             
         Returns:
             True if key is valid and active, False otherwise
         """
-        api_key = self.repo.get_by_key(key)
-        if api_key and api_key.active:
-            # Update last_used timestamp
-            self.repo.update_last_used(key)
-            return True
-        return False
+        key_hash = hash_api_key(key)
+        use_local_cache = _invalidations.is_connected()
+        
+        with _cache_lock:
+            cached = use_local_cache and key_hash in _validated_keys
+            epoch = _invalidation_epoch
+        
+        if not cached:
+            owner = self._get_shared_validation(key_hash)
+            if owner == _REVOKED_MARKER:
+                return False
+            if owner is None:
+                # A Redis miss plus a filter miss means the key is unknown. After a
+                # Redis error the miss proves nothing: a key just issued by another
+                # worker may not be in this worker's filter yet.
+                if _redis_health.available() and not active_key_filter.might_be_active(key_hash):
+                    return False
+                
+                api_key = self.repo.get_by_hash(key_hash)
+                if not api_key or not api_key.active:
+                    return False
+                owner = api_key.email
+                self._set_shared_validation(key_hash, owner)
+            
+            if use_local_cache:
+                with _cache_lock:
+                    if epoch == _invalidation_epoch:
+                        _validated_keys[key_hash] = owner
+        
+        # last_used is written in batches by the background flusher
+        last_used_buffer.record(key_hash)
+        return True
+    
+    def _get_shared_validation(self, key_hash: bytes) -> Optional[str]:
+        """
+        Look up a validated key in Redis
+        
+        Returns:
+            The owner email on a hit, _REVOKED_MARKER for a deactivated key,
+            or None on a miss or while Redis is unavailable
+        """
+        if not _redis_health.available():
+            return None
+        try:
+            owner = redis_client.get(_validated_key_redis_key(key_hash))
+        except redis.RedisError:
+            _redis_health.failed("Error reading validated API key cache")
+            return None
+        return owner.decode() if owner is not None else None
+    
+    def _set_shared_validation(self, key_hash: bytes, owner: str) -> None:
+        """Cache a validated key in Redis for all workers, unless it has been revoked meanwhile"""
+        if not _redis_health.available():
+            return
+        try:
+            # NX: never overwrite a revocation marker written after our database read
+            redis_client.set(_validated_key_redis_key(key_hash), owner, ex=VALIDATED_KEY_TTL, nx=True)
+        except redis.RedisError:
+            _redis_health.failed("Error writing validated API key cache")
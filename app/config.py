@@ -11,10 +11,27 @@ class Config:
     # Flask core settings
     SECRET_KEY = os.environ['SECRET_KEY']
     DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    
+    # Secret for the HMAC under which API keys are stored. Kept separate from
+    # SECRET_KEY so that rotating one does not touch the other: changing it
+    # invalidates every issued API key.
+    API_KEY_HASH_SECRET = os.environ['API_KEY_HASH_SECRET']
     
     # PostgreSQL database URI
     SQLALCHEMY_DATABASE_URI = os.environ['DATABASE_URL']
     
+    # Connection pool per worker process (each holds up to size + overflow connections)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '20'))
+    
+    # Redis URL (verification tokens)
+    REDIS_URL = os.environ['REDIS_URL']
+    
+    # Redis connect/read timeout in seconds. Redis sits on the authentication
+    # path, so an unreachable server must fail fast and fall back to the database.
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', '0.5'))
+    
     # Email configuration for API key verification
     SMTP_HOST = os.environ['SMTP_HOST']
     SMTP_PORT = int(os.environ['SMTP_PORT'])
@@ -30,3 +47,27 @@ class Config:
     
     # ECG Model version (integer)
     MODEL_VERSION = int(os.environ['MODEL_VERSION'])
+    
+    # Maximum number of concurrent ECG signals coalesced into one forward pass
+    ECG_MAX_BATCH_SIZE = int(os.environ.get('ECG_MAX_BATCH_SIZE', '32'))
+    
+    # Maximum number of signals accepted in one request's "ecg_signals" array
+    ECG_MAX_SIGNALS_PER_REQUEST = int(os.environ.get('ECG_MAX_SIGNALS_PER_REQUEST', '64'))
+    
+    # PyTorch intra-op threads per worker process. Each Gunicorn worker is its
+    # own process, so more than one thread per worker oversubscribes the CPUs.
+    TORCH_NUM_THREADS = int(os.environ.get('TORCH_NUM_THREADS', '1'))
+    
+    # Run the classifier's Linear layers as dynamically quantized int8 (CPU only).
+    # Off by default: validate accuracy against the fp32 model before enabling.
+    # Quantized inference runs each signal separately (results would otherwise
+    # depend on the batch), so it gives up the batched forward pass.
+    ECG_QUANTIZE = os.environ.get('ECG_QUANTIZE', 'false').lower() == 'true'
+    
+    # Run the TorchScript model's layers in bfloat16. Only worthwhile on
+    # hardware with native bf16 (AVX512-BF16/AMX CPUs, recent GPUs).
+    ECG_BF16 = os.environ.get('ECG_BF16', 'false').lower() == 'true'
+    
+    # Optional ONNX export of the classifier (`python manage.py export-onnx`).
+    # When the file exists and onnxruntime is installed, inference uses it.
+    ECG_ONNX_PATH = os.environ.get('ECG_ONNX_PATH')
@@ -1,12 +1,46 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import scoped_session, sessionmaker, declarative_base
+from sqlalchemy.pool import StaticPool
 from app.config import Config
 
-engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
 
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+def _build_engine(database_uri: str):
+    """Create the engine with a connection pool suited to the backend"""
+    if make_url(database_uri).get_backend_name() == 'sqlite':
+        # SQLite (local development): share a single connection across threads
+        sqlite_engine = create_engine(
+            database_uri,
+            connect_args={'check_same_thread': False},
+            poolclass=StaticPool
+        )
+        
+        @event.listens_for(sqlite_engine, 'connect')
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            # Applied once per new connection; the pooled connection keeps them
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.close()
+        
+        return sqlite_engine
+    
+    return create_engine(
+        database_uri,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=1800
+    )
 
-Base = declarative_base()
 
-def get_db_connection():
-    return SessionLocal()
\ No newline at end of file
+engine = _build_engine(Config.SQLALCHEMY_DATABASE_URI)
+
+# Thread-local sessions backed by the engine's connection pool. Sessions live for
+# a single request, so objects keep their loaded state after commit instead of
+# being expired and re-SELECTed on next access.
+SessionLocal = scoped_session(
+    sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
+)
+
+Base = declarative_base()
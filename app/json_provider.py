@@ -0,0 +1,47 @@
+"""orjson-backed JSON provider for Flask"""
+import decimal
+import typing as t
+import numpy as np
+import orjson
+from flask import Response
+from flask.json.provider import JSONProvider
+
+
+def _default(obj: t.Any) -> t.Any:
+    """Serialize the few types orjson does not handle natively"""
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    # Numpy values OPT_SERIALIZE_NUMPY leaves to this hook (non-contiguous
+    # arrays, unsupported dtypes), or all of them without the option
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    JSON provider using orjson for request parsing and response encoding
+    
+    Installed as app.json, so request.get_json() and jsonify() use it.
+    """
+    
+    # OPT_SERIALIZE_NUMPY: model outputs (numpy scalars/arrays) encode natively
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    
+    def dumps(self, obj: t.Any, **kwargs: t.Any) -> str:
+        return orjson.dumps(obj, default=_default, option=self.option).decode()
+    
+    def loads(self, s: t.Union[str, bytes], **kwargs: t.Any) -> t.Any:
+        return orjson.loads(s)
+    
+    def response(self, *args: t.Any, **kwargs: t.Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        # Hand orjson's bytes straight to the response, skipping a decode/encode
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=self.option),
+            mimetype='application/json'
+        )
@@ -0,0 +1,53 @@
+"""Application logging setup"""
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+
+_queue_handler: Optional[QueueHandler] = None
+_stream_handler: Optional[logging.Handler] = None
+_listener: Optional[QueueListener] = None
+
+
+def _start_listener() -> None:
+    """Start a listener thread draining a fresh queue into the stream handler"""
+    global _listener
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, _stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def setup_logging(level: str = 'INFO') -> None:
+    """
+    Route all log records through a queue to a background writer thread
+    
+    Request threads only enqueue records; the stderr write happens on the
+    listener thread, so slow or contended output never blocks request
+    handling. Safe to call more than once.
+    
+    Args:
+        level: Root log level name (e.g. "INFO", "DEBUG")
+    """
+    global _queue_handler, _stream_handler
+    if _queue_handler is not None:
+        return
+    
+    _stream_handler = logging.StreamHandler()
+    _stream_handler.setFormatter(
+        logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s')
+    )
+    _queue_handler = QueueHandler(queue.SimpleQueue())
+    
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    
+    _start_listener()
+    atexit.register(lambda: _listener.stop())
+    
+    # The listener thread does not survive fork(); give each worker its own
+    os.register_at_fork(after_in_child=_start_listener)
@@ -0,0 +1,74 @@
+"""Dynamic micro-batching for model inference"""
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item inference calls into batched calls
+    
+    Callers block in submit() while a background thread drains the queue:
+    it waits for the first pending item, then takes whatever else is already
+    queued (up to max_batch_size) and runs batch_fn once for all of them.
+    A lone request is processed immediately, so batching adds no waiting
+    time; under concurrent load the forward pass is shared.
+    """
+    
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 32):
+        """
+        Args:
+            batch_fn: Function mapping a list of inputs to a list of outputs (same order)
+            max_batch_size: Maximum number of inputs passed to one batch_fn call
+        """
+        self._batch_fn = batch_fn
+        self._max_batch_size = max_batch_size
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+    
+    def submit(self, item: Any) -> Any:
+        """Run one input through the next batch and wait for its output"""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future.result()
+    
+    def _ensure_worker(self) -> None:
+        # Threads do not survive fork(), so each worker process starts its own
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+            self._thread.start()
+    
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self._max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                outputs = self._batch_fn(items)
+            except Exception as e:
+                logger.exception("Batched inference failed for %d inputs", len(items))
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
@@ -1,4 +1,7 @@
 """Predictions endpoint controller"""
+import hashlib
+import threading
+from cachetools import LRUCache
 from flask import Blueprint, request, jsonify, current_app
 from app.api_keys.auth import api_key_required
 from app.predictions.ecg_model import ECGModel
@@ -8,6 +11,112 @@ from datetime import datetime
 
 predictions_bp = Blueprint('predictions', __name__)
 
+# Samples per request: 1-lead ECG at 130Hz, 1 second
+ECG_SIGNAL_LENGTH = 130
+
+# Error detail for signals containing NaN or +/-Infinity
+NON_FINITE_ERROR = "must contain only finite values (no NaN or Infinity, and within the float32 range)"
+
+# Physiological features included in the response (when not None)
+RESPONSE_FEATURES = (
+    "heart_rate",
+    "hrv_rmssd",
+    "qrs_duration",
+    "r_amplitude",
+    "signal_energy",
+    "r_peaks_count",
+)
+
+# Recent responses keyed by (model version, signal bytes). Inference is
+# deterministic, so retries and duplicate submissions of the same signal
+# can skip the model entirely.
+_prediction_cache = LRUCache(maxsize=1024)
+_prediction_cache_lock = threading.Lock()
+
+
+def _prediction_cache_key(model_version: int, ecg_array: np.ndarray) -> bytes:
+    """Digest of the model version and the signal's float32 samples"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(model_version).encode())
+    digest.update(np.ascontiguousarray(ecg_array, dtype='<f4').tobytes())
+    return digest.digest()
+
+
+# Map prediction to diagnosis
+DIAGNOSIS_MAP = {
+    "Normal": "Normal Sinus Rhythm",
+    "Abnormal": "Abnormal ECG Pattern"
+}
+
+
+def _format_prediction(label: str, probabilities: dict, physio_features: dict) -> dict:
+    """
+    Build the diagnosis/probability/features part of a prediction response
+    
+    Args:
+        label: Predicted label ("Normal" or "Abnormal")
+        probabilities: Per-label probabilities from the model
+        physio_features: Physiological features from the model
+        
+    Returns:
+        Dictionary with diagnosis, probability of the predicted class, and features
+    """
+    # Format features - remove None values and add only valid features
+    features = {
+        key: physio_features[key]
+        for key in RESPONSE_FEATURES
+        if physio_features.get(key) is not None
+    }
+    
+    return {
+        "diagnosis": DIAGNOSIS_MAP.get(label, "Unknown"),
+        "probability": round(probabilities[label], 4),
+        "features": features
+    }
+
+
+def _predict_many(ecg_signals):
+    """Handle a JSON body with an "ecg_signals" array of signals"""
+    max_signals = current_app.config['ECG_MAX_SIGNALS_PER_REQUEST']
+    
+    if not isinstance(ecg_signals, list) or not ecg_signals:
+        return jsonify({"error": "ecg_signals must be a non-empty array of signals"}), 400
+    
+    if len(ecg_signals) > max_signals:
+        return jsonify({
+            "error": f"ecg_signals may contain at most {max_signals} signals (got {len(ecg_signals)})"
+        }), 400
+    
+    for i, ecg_signal in enumerate(ecg_signals):
+        if not isinstance(ecg_signal, list) or len(ecg_signal) != ECG_SIGNAL_LENGTH:
+            return jsonify({
+                "error": f"ecg_signals[{i}] must be an array of exactly 130 values",
+                "note": "This model expects 130Hz sampling rate with 1-second duration"
+            }), 400
+    
+    try:
+        ecg_arrays = np.asarray(ecg_signals, dtype=np.float32)
+    except Exception as e:
+        return jsonify({"error": f"Invalid ecg_signals format: {str(e)}"}), 400
+    
+    non_finite = np.flatnonzero(~np.isfinite(ecg_arrays).all(axis=1))
+    if non_finite.size:
+        return jsonify({"error": f"ecg_signals[{non_finite[0]}] {NON_FINITE_ERROR}"}), 400
+    
+    # One forward pass for every signal in the request
+    model: ECGModel = current_app.extensions['ecg_model']
+    results = model.predict_many(ecg_arrays)
+    
+    response = {
+        "modelVersion": current_app.config.get('MODEL_VERSION', 1),
+        "predictions": [
+            _format_prediction(label, probabilities, physio_features)
+            for label, probabilities, physio_features, _ in results
+        ]
+    }
+    
+    return jsonify(response), 200
+
 
 @predictions_bp.route('/', methods=['POST'])
 @api_key_required
@@ -17,10 +126,18 @@ def predict_ecg():
     
     Requires: x-api-key header with valid API key
     
-    Body:
+    Body (application/json):
         {
             "ecg_signal": [array of 130 float values for 130Hz 1-lead ECG]
         }
+        or, to classify several signals in one request:
+        {
+            "ecg_signals": [[130 float values], ...]
+        }
+        (the response then has a "predictions" array, one entry per signal)
+    
+    Body (application/octet-stream):
+        520 bytes: the same 130 samples as little-endian float32
     
     Returns:
         200: JSON with prediction results
@@ -29,75 +146,79 @@ def predict_ecg():
         500: Model inference error
     """
     try:
-        data = request.get_json()
-        
-        # Validate request body
-        if not data or 'ecg_signal' not in data:
-            return jsonify({
-                "error": "Missing required field: ecg_signal",
-                "expected_format": {
-                    "ecg_signal": "array of 130 float values"
-                }
-            }), 400
+        if request.mimetype == 'application/octet-stream':
+            # Fast path: raw little-endian float32 samples, decoded without
+            # building a JSON list of Python floats
+            body = request.get_data(cache=False)
+            expected_bytes = ECG_SIGNAL_LENGTH * np.dtype('<f4').itemsize
+            if len(body) != expected_bytes:
+                return jsonify({
+                    "error": f"Binary ecg_signal must be exactly {expected_bytes} bytes "
+                             f"({ECG_SIGNAL_LENGTH} little-endian float32 values, got {len(body)} bytes)",
+                    "note": "This model expects 130Hz sampling rate with 1-second duration"
+                }), 400
+            ecg_array = np.frombuffer(body, dtype='<f4')
+        else:
+            data = request.get_json()
+            
+            # Validate request body (any other JSON value, e.g. a string or a
+            # list, would turn the key checks below into substring/membership tests)
+            if not isinstance(data, dict) or ('ecg_signal' not in data and 'ecg_signals' not in data):
+                return jsonify({
+                    "error": "Missing required field: ecg_signal",
+                    "expected_format": {
+                        "ecg_signal": "array of 130 float values"
+                    }
+                }), 400
+            
+            if 'ecg_signals' in data:
+                return _predict_many(data['ecg_signals'])
+            
+            ecg_signal = data['ecg_signal']
+            
+            # Validate ECG signal format
+            if not isinstance(ecg_signal, list):
+                return jsonify({"error": "ecg_signal must be an array"}), 400
+            
+            if len(ecg_signal) != ECG_SIGNAL_LENGTH:
+                return jsonify({
+                    "error": f"ecg_signal must have exactly 130 values (got {len(ecg_signal)})",
+                    "note": "This model expects 130Hz sampling rate with 1-second duration"
+                }), 400
+            
+            # Convert to numpy array
+            try:
+                ecg_array = np.asarray(ecg_signal, dtype=np.float32)
+            except Exception as e:
+                return jsonify({"error": f"Invalid ecg_signal format: {str(e)}"}), 400
         
-        ecg_signal = data['ecg_signal']
-        
-        # Validate ECG signal format
-        if not isinstance(ecg_signal, list):
-            return jsonify({"error": "ecg_signal must be an array"}), 400
-        
-        if len(ecg_signal) != 130:
-            return jsonify({
-                "error": f"ecg_signal must have exactly 130 values (got {len(ecg_signal)})",
-                "note": "This model expects 130Hz sampling rate with 1-second duration"
-            }), 400
-        
-        # Convert to numpy array
-        try:
-            ecg_array = np.array(ecg_signal, dtype=np.float32)
-        except Exception as e:
-            return jsonify({"error": f"Invalid ecg_signal format: {str(e)}"}), 400
-        
-        # Get model instance and perform prediction
-        model = ECGModel()
-        label, probabilities, physio_features, embedding = model.predict(ecg_array)
+        # NaN and Infinity decode fine (and JSON values beyond the float32 range
+        # become inf), but would silently produce a meaningless prediction
+        if not np.isfinite(ecg_array).all():
+            return jsonify({"error": f"ecg_signal {NON_FINITE_ERROR}"}), 400
         
         # Get model version from config
         model_version = current_app.config.get('MODEL_VERSION', 1)
         
-        # Map prediction to diagnosis
-        diagnosis_map = {
-            "Normal": "Normal Sinus Rhythm",
-            "Abnormal": "Abnormal ECG Pattern"
-        }
-        diagnosis = diagnosis_map.get(label, "Unknown")
-        
-        # Get the probability of the predicted class
-        probability = round(probabilities[label], 4)
+        cache_key = _prediction_cache_key(model_version, ecg_array)
+        with _prediction_cache_lock:
+            cached = _prediction_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached), 200
         
-        # Format features - remove None values and add only valid features
-        features = {}
-        if physio_features.get("heart_rate") is not None:
-            features["heart_rate"] = physio_features["heart_rate"]
-        if physio_features.get("hrv_rmssd") is not None:
-            features["hrv_rmssd"] = physio_features["hrv_rmssd"]
-        if physio_features.get("qrs_duration") is not None:
-            features["qrs_duration"] = physio_features["qrs_duration"]
-        if physio_features.get("r_amplitude") is not None:
-            features["r_amplitude"] = physio_features["r_amplitude"]
-        if physio_features.get("signal_energy") is not None:
-            features["signal_energy"] = physio_features["signal_energy"]
-        if physio_features.get("r_peaks_count") is not None:
-            features["r_peaks_count"] = physio_features["r_peaks_count"]
+        # Get the shared model instance and perform prediction
+        model: ECGModel = current_app.extensions['ecg_model']
+        label, probabilities, physio_features, embedding = model.predict(ecg_array)
         
         # Build response matching the required format
         response = {
             "modelVersion": model_version,
-            "diagnosis": diagnosis,
-            "probability": probability,
-            "features": features
+            **_format_prediction(label, probabilities, physio_features)
         }
         
+        with _prediction_cache_lock:
+            _prediction_cache[cache_key] = response
+        
         return jsonify(response), 200
         
     except RuntimeError as e:
@@ -2,22 +2,73 @@
 ECG-FM Fine-tuned Model for ECG Classification
 Based on the PyTorch implementation from ecg-fm-finetuned.ipynb
 """
+import copy
+import logging
 import torch
 import torch.nn as nn
 import numpy as np
 import os
-from typing import Tuple, Dict
+from functools import lru_cache
+from typing import Tuple, Dict, List, Optional
 import scipy.signal as sps
+from app.predictions.batcher import MicroBatcher
+
+
+logger = logging.getLogger(__name__)
+
+# Signals with a lower standard deviation are treated as flat (no usable ECG)
+FLAT_SIGNAL_STD = 1e-4
+
+
+@lru_cache(maxsize=None)
+def _bandpass(fs: int) -> np.ndarray:
+    """3rd-order 0.5-40 Hz Butterworth bandpass as second-order sections for sampling rate fs"""
+    # float64, like the reported features: in float32 the rounded r_amplitude
+    # and signal_energy drift visibly, and 130 samples cost next to nothing
+    return sps.butter(3, [0.5/(fs/2), 40/(fs/2)], btype='band', output='sos')
+
+
+# Design the filter for the API's fixed 130Hz rate at import, not on the first request
+_bandpass(130)
+
+
+def configure_torch_threads(num_threads: int) -> None:
+    """
+    Set PyTorch's process-wide intra-op and inter-op thread counts
+    
+    Args:
+        num_threads: Intra-op threads; inter-op threads are pinned to 1
+    """
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set before any inter-op parallel work has run
+        logger.debug("PyTorch inter-op thread pool already started; leaving it as is")
+
+
+class ZScore(nn.Module):
+    """Per-signal z-score normalization over the last dimension (no parameters)"""
+    
+    def forward(self, x):
+        mean = x.mean(dim=-1, keepdim=True)
+        std = x.std(dim=-1, keepdim=True, unbiased=False) + 1e-6
+        return (x - mean) / std
 
 
 class ECGFMClassifier(nn.Module):
     """
     ECG Foundation Model Classifier
     Fine-tuned for binary classification (Normal vs Abnormal)
+    
+    Takes raw signals [B, 1, length]; z-score normalization is the first op of
+    the graph. It is kept outside `encoder` so the checkpoint's state_dict keys
+    are unchanged.
     """
     
     def __init__(self, input_dim=130, hidden_dim=256, num_classes=2):
         super().__init__()
+        self.normalize = ZScore()
         self.encoder = nn.Sequential(
             nn.Conv1d(1, 16, 7, padding=3),
             nn.ReLU(),
@@ -35,17 +86,54 @@ class ECGFMClassifier(nn.Module):
         )
 
     def forward(self, x, return_features=False):
-        feats = self.encoder(x)
+        feats = self.encoder(self.normalize(x))
         logits = self.classifier(feats)
         if return_features:
             return logits, feats.squeeze(-1)
         return logits
 
 
+class _FeatureForward(nn.Module):
+    """Fixed-signature view of ECGFMClassifier returning (logits, features), for tracing"""
+    
+    def __init__(self, model: ECGFMClassifier):
+        super().__init__()
+        self.model = model
+    
+    def forward(self, x):
+        return self.model(x, return_features=True)
+
+
+class _BFloat16FeatureForward(nn.Module):
+    """
+    _FeatureForward with the encoder and classifier run in bfloat16, for tracing
+    
+    Works on bfloat16 copies of the layers, so the float32 model is left
+    untouched. Normalization and the returned (logits, features) stay
+    float32; the casts are explicit, so tracing needs no autocast.
+    """
+    
+    def __init__(self, model: ECGFMClassifier):
+        super().__init__()
+        self.normalize = model.normalize
+        self.encoder = copy.deepcopy(model.encoder).to(torch.bfloat16)
+        self.classifier = copy.deepcopy(model.classifier).to(torch.bfloat16)
+    
+    def forward(self, x):
+        feats = self.encoder(self.normalize(x).to(torch.bfloat16))
+        logits = self.classifier(feats)
+        return logits.float(), feats.squeeze(-1).float()
+
+
 class ECGModel:
     """
     Singleton wrapper for ECG-FM model inference
     Handles model loading and prediction
+    
+    Concurrent predict() calls are coalesced by a MicroBatcher into a single
+    forward pass over a [B, 1, length] batch. The forward pass runs through an
+    ONNX Runtime session when an exported model is available, otherwise through
+    a frozen TorchScript trace of the classifier to skip per-module Python dispatch.
     """
     _instance = None
     
@@ -53,36 +141,186 @@ class ECGModel:
         if cls._instance is None:
             cls._instance = super(ECGModel, cls).__new__(cls)
             cls._instance._model = None
+            cls._instance._scripted_model = None
+            cls._instance._onnx_session = None
+            cls._instance._pinned = None
+            cls._instance._per_sample = False
             cls._instance._device = None
+            cls._instance._batcher = None
         return cls._instance
     
-    def load(self, model_path: str) -> None:
+    def load(
+        self,
+        model_path: str,
+        max_batch_size: int = 32,
+        quantize: bool = False,
+        bf16: bool = False,
+        onnx_path: Optional[str] = None
+    ) -> None:
         """
         Load the fine-tuned ECG model weights
         
         Args:
             model_path: Path to the .pt model weights file
+            max_batch_size: Maximum number of signals per batched forward pass
+            quantize: Dynamically quantize the Linear layers to int8 (ignored on CUDA);
+                signals are then run through the model one at a time
+            bf16: Run the traced encoder and classifier in bfloat16 (ignored when quantizing)
+            onnx_path: Exported .onnx model to serve with ONNX Runtime instead of
+                TorchScript, if the file exists (takes precedence over quantize)
         """
-        if self._model is None:
-            try:
-                # Determine device (CPU or CUDA)
-                self._device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-                
-                # Initialize model
-                self._model = ECGFMClassifier().to(self._device)
+        if self._batcher is not None:
+            return
+        
+        # Everything is built in locals and published only once loading has
+        # fully succeeded, so a failed load leaves the instance unloaded (and
+        # a later load() call retries) instead of half-initialised
+        try:
+            # Determine device (CPU or CUDA)
+            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"Model file not found: {model_path}")
+            
+            # Initialize model and load weights. The checkpoint is memory-mapped and
+            # its tensors adopted as the parameters instead of copied into fresh ones.
+            model = ECGFMClassifier().to(device)
+            state_dict = torch.load(model_path, map_location=device, mmap=True, weights_only=True)
+            model.load_state_dict(state_dict, assign=True)
+            model.eval()
+            
+            onnx_session = None
+            scripted_model = None
+            pinned = None
+            per_sample = False
+            
+            if onnx_path and os.path.exists(onnx_path):
+                onnx_session = self._create_onnx_session(onnx_path)
+                logger.info("ECG model served with ONNX Runtime from: %s", onnx_path)
+            else:
+                if onnx_path:
+                    logger.warning("ONNX model not found at %s, using TorchScript", onnx_path)
                 
-                # Load weights
-                if os.path.exists(model_path):
-                    self._model.load_state_dict(
-                        torch.load(model_path, map_location=self._device)
+                inference_model = model
+                use_bf16 = bf16
+                if quantize and device.type == "cpu":
+                    # Dynamic quantization only covers Linear; the Conv1d encoder stays fp32
+                    inference_model = torch.quantization.quantize_dynamic(
+                        model, {nn.Linear}, dtype=torch.qint8
                     )
-                    self._model.eval()
-                    print(f"✅ ECG model loaded from: {model_path}")
-                else:
-                    raise FileNotFoundError(f"Model file not found: {model_path}")
-                    
-            except Exception as e:
-                raise RuntimeError(f"Failed to load ECG model: {str(e)}")
+                    logger.info("ECG classifier Linear layers quantized to int8")
+                    # Quantized Linear kernels take float32 input, not bfloat16
+                    use_bf16 = False
+                    per_sample = True
+                elif bf16:
+                    logger.info("ECG model traced with bfloat16 encoder and classifier")
+                
+                scripted_model = self._trace(inference_model, device, bf16=use_bf16)
+                
+                if device.type == "cuda":
+                    # Page-locked staging buffer so batches are copied to the GPU asynchronously
+                    pinned = torch.empty(max_batch_size, 1, 130, pin_memory=True)
+        
+        except Exception as e:
+            raise RuntimeError(f"Failed to load ECG model: {str(e)}")
+        
+        self._device = device
+        self._model = model
+        self._onnx_session = onnx_session
+        self._scripted_model = scripted_model
+        self._pinned = pinned
+        self._per_sample = per_sample
+        # Published last: predict() treats the model as loaded once the batcher exists
+        self._batcher = MicroBatcher(self._run_batch, max_batch_size=max_batch_size)
+        logger.info("ECG model loaded from: %s", model_path)
+    
+    def _trace(self, model: nn.Module, device: torch.device, bf16: bool = False) -> torch.jit.ScriptModule:
+        """
+        Trace and freeze the classifier, then warm it up
+        
+        Args:
+            model: Classifier in eval mode with weights loaded
+            device: Device the model's weights are on
+            bf16: Trace a bfloat16 copy of the encoder and classifier instead
+            
+        Returns:
+            Frozen TorchScript module mapping x [B, 1, length] to (logits, features)
+        """
+        example = torch.zeros(1, 1, 130, device=device)
+        wrapper = _BFloat16FeatureForward(model) if bf16 else _FeatureForward(model)
+        with torch.no_grad():
+            # The wrapper has its own training flag, which the trace copies;
+            # freeze() only accepts modules in eval mode
+            scripted = torch.jit.freeze(torch.jit.trace(wrapper.eval(), example))
+        # The first calls run the profiling/optimisation passes; pay them at startup
+        with torch.inference_mode():
+            for _ in range(2):
+                scripted(example)
+        self._check_traced(scripted, device)
+        return scripted
+    
+    def _check_traced(self, scripted: torch.jit.ScriptModule, device: torch.device) -> None:
+        """
+        Run a small batch of synthetic signals through the traced model
+        
+        Fails load() at startup, instead of on the first request, if the traced
+        graph does not produce finite [B, num_classes] probabilities.
+        
+        Args:
+            scripted: Traced model returned by torch.jit.freeze()
+            device: Device the traced model runs on
+        """
+        t = torch.arange(130, dtype=torch.float32, device=device) / 130
+        # Two distinct 1-second sinusoids (72 and 120 bpm), batched as [2, 1, 130]
+        signals = torch.stack([torch.sin(2 * np.pi * 1.2 * t), torch.sin(2 * np.pi * 2.0 * t)]).unsqueeze(1)
+        with torch.inference_mode():
+            output, features = scripted(signals)
+            probs = torch.softmax(output, dim=1)
+        
+        if probs.shape[0] != 2 or features.shape[0] != 2:
+            raise RuntimeError(f"Traced model returned unexpected shapes {tuple(probs.shape)}, {tuple(features.shape)}")
+        if not bool(torch.isfinite(probs).all()):
+            raise RuntimeError("Traced model produced non-finite probabilities")
+    
+    def _create_onnx_session(self, onnx_path: str):
+        """
+        Create an ONNX Runtime CPU session for an exported classifier
+        
+        Args:
+            onnx_path: Path to the .onnx file written by export_onnx()
+            
+        Returns:
+            onnxruntime.InferenceSession with full graph optimizations
+        """
+        # Optional dependency, only needed when an ONNX model is configured
+        import onnxruntime as ort
+        
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.intra_op_num_threads = torch.get_num_threads()
+        opts.inter_op_num_threads = 1
+        return ort.InferenceSession(onnx_path, sess_options=opts, providers=["CPUExecutionProvider"])
+    
+    def export_onnx(self, onnx_path: str) -> None:
+        """
+        Export the loaded classifier to ONNX with a dynamic batch dimension
+        
+        Args:
+            onnx_path: Destination .onnx file
+        """
+        if self._model is None:
+            raise RuntimeError("Model not loaded. Call load() first.")
+        
+        example = torch.zeros(1, 1, 130, device=self._device)
+        with torch.no_grad():
+            torch.onnx.export(
+                _FeatureForward(self._model).eval(),
+                example,
+                onnx_path,
+                input_names=["x"],
+                output_names=["logits", "features"],
+                dynamic_axes={"x": {0: "batch"}, "logits": {0: "batch"}, "features": {0: "batch"}}
+            )
     
     def preprocess(self, ecg_signal: np.ndarray) -> torch.Tensor:
         """
@@ -92,18 +330,62 @@ class ECGModel:
             ecg_signal: 1D numpy array of ECG signal (length=130 for 130Hz, 1-lead)
             
         Returns:
-            Preprocessed tensor ready for model input [1, 1, length]
+            Model input tensor [1, 1, length] on the CPU (normalization happens
+            inside the model; predict_batch moves batches to the device)
         """
-        # Normalize signal (z-score normalization)
-        signal_mean = np.mean(ecg_signal)
-        signal_std = np.std(ecg_signal) + 1e-6
-        normalized = (ecg_signal - signal_mean) / signal_std
+        signal = np.ascontiguousarray(ecg_signal, dtype=np.float32)
+        if not signal.flags.writeable:
+            # e.g. np.frombuffer over the request body; torch needs a writable buffer
+            signal = signal.copy()
         
-        # Convert to tensor and add batch/channel dimensions
-        tensor = torch.tensor(normalized, dtype=torch.float32)
-        tensor = tensor.unsqueeze(0).unsqueeze(0)  # [1, 1, length]
+        # Wrap the float32 buffer without copying and add batch/channel dimensions
+        return torch.from_numpy(signal).view(1, 1, -1)  # [1, 1, length]
+    
+    def predict_batch(self, x: torch.Tensor) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Run one forward pass over a batch of preprocessed signals
+        
+        Args:
+            x: Preprocessed input tensor [B, 1, length]
+            
+        Returns:
+            Tuple of (probabilities [B, num_classes], embeddings [B, embedding_dim])
+        """
+        if self._scripted_model is None and self._onnx_session is None:
+            raise RuntimeError("Model not loaded. Call load() first.")
         
-        return tensor.to(self._device)
+        if self._onnx_session is not None:
+            output, features = self._onnx_session.run(None, {"x": x.cpu().numpy()})
+            probs = torch.softmax(torch.from_numpy(output), dim=1)
+            return probs.numpy(), features
+        
+        # Asynchronous when x is pinned; the .cpu() calls below wait for the stream
+        x = x.to(self._device, non_blocking=True)
+        
+        with torch.inference_mode():
+            if self._per_sample:
+                # Dynamic quantization scales activations by the range of the whole
+                # input tensor, so a batched signal's result would depend on the
+                # other signals in its batch; run each one on its own instead
+                outputs = [self._scripted_model(x[i:i + 1]) for i in range(x.shape[0])]
+                output = torch.cat([o for o, _ in outputs])
+                features = torch.cat([f for _, f in outputs])
+            else:
+                output, features = self._scripted_model(x)
+            probs = torch.softmax(output, dim=1)
+        
+        return probs.cpu().numpy(), features.cpu().numpy()
+    
+    def _run_batch(self, inputs: List[torch.Tensor]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Batch function for the MicroBatcher: stack [1, 1, length] inputs and split the results"""
+        if self._pinned is not None:
+            # Only the batcher thread uses the staging buffer, and predict_batch
+            # has finished reading it by the time it returns
+            batch = torch.cat(inputs, dim=0, out=self._pinned[:len(inputs)])
+        else:
+            batch = torch.cat(inputs, dim=0)
+        probs, features = self.predict_batch(batch)
+        return list(zip(probs, features))
     
     def compute_physiological_features(self, ecg_signal: np.ndarray, fs: int = 130) -> Dict:
         """
@@ -118,31 +400,39 @@ class ECGModel:
             Dictionary of physiological features
         """
         try:
-            # Remove DC offset
-            ecg = ecg_signal - np.mean(ecg_signal)
+            # Remove DC offset (on the float32 samples the model also sees)
+            ecg = np.asarray(ecg_signal, dtype=np.float32)
+            ecg = ecg - ecg.mean()
             
-            # Bandpass filter 0.5-40 Hz
-            b, a = sps.butter(3, [0.5/(fs/2), 40/(fs/2)], btype='band')
-            ecg_filt = sps.filtfilt(b, a, ecg)
+            # A flat signal has no R-peaks; skip filtering and peak detection.
+            # ecg is zero-mean, so this is its standard deviation.
+            if np.sqrt(np.dot(ecg, ecg) / len(ecg)) < FLAT_SIGNAL_STD:
+                return {
+                    "heart_rate": None,
+                    "hrv_rmssd": None,
+                    "qrs_duration": None,
+                    "r_amplitude": 0.0,
+                    "signal_energy": 0.0,
+                    "note": "Flat signal, no R-peaks detected"
+                }
+            
+            # Bandpass filter 0.5-40 Hz (the float64 sections give a float64 result)
+            ecg_filt = sps.sosfiltfilt(_bandpass(fs), ecg)
             
             # Simple R-peak detection using local maxima
             # Find peaks with minimum distance of 0.4s (min 150 bpm)
             min_distance = int(0.4 * fs)
-            threshold = 0.3 * np.max(ecg_filt)
-            
-            peaks = []
-            for i in range(min_distance, len(ecg_filt) - min_distance):
-                if ecg_filt[i] > threshold:
-                    # Check if it's a local maximum
-                    is_peak = True
-                    for j in range(i - min_distance, i + min_distance):
-                        if j != i and ecg_filt[j] >= ecg_filt[i]:
-                            is_peak = False
-                            break
-                    if is_peak:
-                        peaks.append(i)
-            
-            rpeaks = np.array(peaks)
+            peak_max = float(np.max(ecg_filt))
+            threshold = 0.3 * peak_max
+            
+            # Amplitude/energy summaries, computed once for either return path
+            r_amplitude = round(peak_max, 3)
+            signal_energy = round(float(np.dot(ecg_filt, ecg_filt)), 4)
+            
+            peaks, _ = sps.find_peaks(ecg_filt, height=threshold, distance=min_distance)
+            
+            # Ignore peaks closer than min_distance to either edge (no full window)
+            rpeaks = peaks[(peaks >= min_distance) & (peaks < len(ecg_filt) - min_distance)]
             
             # Check if we have enough R peaks
             if len(rpeaks) < 2:
@@ -150,8 +440,8 @@ class ECGModel:
                     "heart_rate": None,
                     "hrv_rmssd": None,
                     "qrs_duration": None,
-                    "r_amplitude": round(float(np.max(ecg_filt)), 3),
-                    "signal_energy": round(float(np.sum(ecg_filt**2)), 4),
+                    "r_amplitude": r_amplitude,
+                    "signal_energy": signal_energy,
                     "note": "Insufficient R-peaks detected"
                 }
             
@@ -185,8 +475,8 @@ class ECGModel:
                 "heart_rate": hr,
                 "hrv_rmssd": hrv_rmssd,
                 "qrs_duration": qrs_duration,
-                "r_amplitude": round(float(np.max(ecg_filt)), 3),
-                "signal_energy": round(float(np.sum(ecg_filt**2)), 4),
+                "r_amplitude": r_amplitude,
+                "signal_energy": signal_energy,
                 "r_peaks_count": int(len(rpeaks))
             }
             
@@ -211,29 +501,53 @@ class ECGModel:
             - features_dict: Physiological features (HR, HRV, QRS, etc.)
             - embedding: Feature embedding from encoder (for advanced analysis)
         """
-        if self._model is None:
+        if self._batcher is None:
             raise RuntimeError("Model not loaded. Call load() first.")
         
         # Preprocess input
         x = self.preprocess(ecg_signal)
         
-        # Inference
-        with torch.no_grad():
-            output, features = self._model(x, return_features=True)
-            probs = torch.softmax(output, dim=1).cpu().numpy().flatten()
-            pred_label_idx = np.argmax(probs)
-        
-        # Map to labels
-        label = "Normal" if pred_label_idx == 0 else "Abnormal"
-        
-        probabilities = {
-            "Normal": round(float(probs[0]), 4),
-            "Abnormal": round(float(probs[1]), 4)
-        }
+        # Inference, batched with any concurrent requests
+        probs, features = self._batcher.submit(x)
+        label, probabilities = self._label(probs)
         
         # Compute physiological features
         physio_features = self.compute_physiological_features(ecg_signal)
         
-        embedding = features.cpu().numpy().flatten()
+        embedding = features.flatten()
         
         return label, probabilities, physio_features, embedding
+    
+    def predict_many(self, ecg_signals: np.ndarray) -> List[Tuple[str, Dict[str, float], Dict, np.ndarray]]:
+        """
+        Predict several ECG signals from one request with a single forward pass
+        
+        Args:
+            ecg_signals: 2D numpy array of ECG signals [count, length]
+            
+        Returns:
+            List of (prediction_label, probabilities_dict, features_dict, embedding),
+            one per signal, in the same order (see predict())
+        """
+        if self._scripted_model is None and self._onnx_session is None:
+            raise RuntimeError("Model not loaded. Call load() first.")
+        
+        x = torch.from_numpy(np.array(ecg_signals, dtype=np.float32)).unsqueeze(1)  # [count, 1, length]
+        probs, features = self.predict_batch(x)
+        
+        results = []
+        for signal, signal_probs, embedding in zip(ecg_signals, probs, features):
+            label, probabilities = self._label(signal_probs)
+            physio_features = self.compute_physiological_features(signal)
+            results.append((label, probabilities, physio_features, embedding))
+        return results
+    
+    @staticmethod
+    def _label(probs: np.ndarray) -> Tuple[str, Dict[str, float]]:
+        """Map class probabilities [num_classes] to (label, rounded probabilities dict)"""
+        label = "Normal" if np.argmax(probs) == 0 else "Abnormal"
+        probabilities = {
+            "Normal": round(float(probs[0]), 4),
+            "Abnormal": round(float(probs[1]), 4)
+        }
+        return label, probabilities
@@ -0,0 +1,14 @@
+"""Shared Redis client"""
+import redis
+from app.config import Config
+
+# Backed by a connection pool; redis-py replaces the pool's connections after
+# fork(), so the client is safe to create before Gunicorn forks workers.
+# Idle connections are PINGed before reuse, which is also how a pub/sub
+# subscription notices a dead connection.
+redis_client = redis.Redis.from_url(
+    Config.REDIS_URL,
+    socket_timeout=Config.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=Config.REDIS_SOCKET_TIMEOUT,
+    health_check_interval=15
+)
@@ -0,0 +1,35 @@
+"""Gunicorn configuration for the Heartify API"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+
+# Threaded workers let concurrent predictions in one process share a batched
+# forward pass (see app.predictions.batcher)
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+
+def _cuda_available() -> bool:
+    """Check for a CUDA device without initialising CUDA in this process"""
+    # The NVML-based check does not touch the CUDA runtime, so it is fork-safe
+    os.environ.setdefault('PYTORCH_NVML_BASED_CUDA_CHECK', '1')
+    import torch
+    return torch.cuda.is_available()
+
+
+# Build the app (and load the ECG model weights) once in the master process;
+# forked workers then share the read-only weight pages copy-on-write instead
+# of each loading its own copy. Not on CUDA hosts: a CUDA context created in
+# the master is unusable in forked workers, so there each worker builds the
+# app and loads the model onto the GPU itself, at the cost of slower startup
+# and one copy of the weights per worker.
+preload_app = not _cuda_available()
+
+
+def post_fork(server, worker):
+    """Give each worker its own database connection pool"""
+    from app.database import engine
+    
+    # Drop pooled connections inherited from the master without closing them,
+    # so the master's sockets are not shared with (or shut down by) workers
+    engine.dispose(close=False)
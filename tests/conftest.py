@@ -0,0 +1,19 @@
+"""Test configuration: placeholder settings so app modules can be imported"""
+import os
+
+# Config reads its required settings at import time; nothing here connects
+for name, value in {
+    'SECRET_KEY': 'test-secret-key',
+    'API_KEY_HASH_SECRET': 'test-api-key-hash-secret',
+    'DATABASE_URL': 'sqlite://',
+    'REDIS_URL': 'redis://localhost:6379/0',
+    'SMTP_HOST': 'localhost',
+    'SMTP_PORT': '25',
+    'SMTP_USER': 'test',
+    'SMTP_PASSWORD': 'test',
+    'SENDER_EMAIL': 'noreply@example.com',
+    'BASE_URL': 'http://localhost:5000',
+    'ECG_MODEL_PATH': os.path.join(os.path.dirname(__file__), '..', 'model', 'ecg_finetuned_130hz.pt'),
+    'MODEL_VERSION': '1',
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,61 @@
+"""Tests for ECG model inference"""
+import os
+import numpy as np
+import pytest
+import scipy.signal as sps
+import torch
+from app.predictions.ecg_model import ECGModel
+
+
+MODEL_PATH = os.environ['ECG_MODEL_PATH']
+
+
+@pytest.fixture
+def fresh_model():
+    """A new, unloaded ECGModel (it is a process-wide singleton)"""
+    ECGModel._instance = None
+    yield ECGModel()
+    ECGModel._instance = None
+
+
+def _signals(count: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    t = np.arange(130) / 130
+    return np.stack([
+        np.sin(2 * np.pi * (1 + i / 4) * t) * (1 + i) + rng.normal(0, 0.05 * (i + 1), 130)
+        for i in range(count)
+    ]).astype(np.float32)
+
+
+def test_quantized_results_do_not_depend_on_batch(fresh_model):
+    fresh_model.load(MODEL_PATH, quantize=True)
+    signals = _signals(8)
+    
+    batch_probs, batch_features = fresh_model.predict_batch(torch.from_numpy(signals).unsqueeze(1))
+    for i, signal in enumerate(signals):
+        probs, features = fresh_model.predict_batch(torch.from_numpy(signal).view(1, 1, -1))
+        np.testing.assert_array_equal(batch_probs[i], probs[0])
+        np.testing.assert_array_equal(batch_features[i], features[0])
+
+
+def _baseline_features(ecg_signal: np.ndarray, fs: int = 130) -> dict:
+    """Amplitude/energy features as computed by the original filtfilt implementation"""
+    ecg = ecg_signal - np.mean(ecg_signal)
+    b, a = sps.butter(3, [0.5/(fs/2), 40/(fs/2)], btype='band')
+    ecg_filt = sps.filtfilt(b, a, ecg)
+    return {
+        "r_amplitude": round(float(np.max(ecg_filt)), 3),
+        "signal_energy": round(float(np.sum(ecg_filt**2)), 4)
+    }
+
+
+@pytest.mark.parametrize("scale", [1.0, 50.0, 2000.0, 100000.0])
+def test_features_match_baseline(scale):
+    model = ECGModel()
+    for signal in _signals(8) * scale:
+        features = model.compute_physiological_features(signal)
+        expected = _baseline_features(signal)
+        assert features["r_amplitude"] == expected["r_amplitude"]
+        # sosfiltfilt and filtfilt agree to ~1e-11 relative, which only shows at
+        # 4 decimals for very large energies; float32 filtering is off by ~1e-6
+        assert features["signal_energy"] == pytest.approx(expected["signal_energy"], rel=1e-10, abs=1e-4)
@@ -0,0 +1,16 @@
+"""Tests for the orjson JSON provider"""
+import numpy as np
+import orjson
+from app.json_provider import OrjsonProvider, _default
+
+
+def test_numpy_values_serialize_with_and_without_the_option():
+    payload = {
+        "heart_rate": np.float64(72.5),
+        "count": np.int64(2),
+        "embedding": np.arange(6, dtype=np.float32).reshape(2, 3)[:, ::2],
+    }
+    expected = {"heart_rate": 72.5, "count": 2, "embedding": [[0.0, 2.0], [3.0, 5.0]]}
+    
+    assert orjson.loads(orjson.dumps(payload, default=_default, option=OrjsonProvider.option)) == expected
+    assert orjson.loads(orjson.dumps(payload, default=_default)) == expected
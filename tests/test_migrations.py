@@ -0,0 +1,85 @@
+"""Tests for the raw API key to hashed key migration"""
+from datetime import datetime
+from sqlalchemy import Boolean, Column, DateTime, String, create_engine, inspect
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.sql import func
+from app.api_keys.entity import ApiKey
+from app.api_keys.migrations import LEGACY_TABLE, migrate_raw_keys_to_hashes
+from app.api_keys.repository import ApiKeyRepository
+from app.api_keys.service import hash_api_key
+
+
+LegacyBase = declarative_base()
+
+
+class LegacyApiKey(LegacyBase):
+    """The api_keys table as created before keys were hashed"""
+    __tablename__ = "api_keys"
+    
+    api_key = Column(String, primary_key=True, nullable=False)
+    email = Column(String, nullable=False, index=True)
+    active = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    last_used = Column(DateTime, nullable=True)
+
+
+def _legacy_engine(tmp_path, rows):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    LegacyBase.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add_all(LegacyApiKey(**row) for row in rows)
+        db.commit()
+    return engine
+
+
+def test_migration_keeps_keys_valid(tmp_path):
+    last_used = datetime(2024, 5, 1, 12, 30, 15)
+    engine = _legacy_engine(tmp_path, [
+        {'api_key': 'key-a', 'email': 'a@example.com', 'active': True, 'last_used': last_used},
+        {'api_key': 'key-b', 'email': 'b@example.com', 'active': False},
+    ])
+    
+    with engine.begin() as conn:
+        assert migrate_raw_keys_to_hashes(conn) == 2
+    
+    assert not inspect(engine).has_table(LEGACY_TABLE)
+    with Session(engine) as db:
+        repo = ApiKeyRepository(db)
+        key_a = repo.get_by_hash(hash_api_key('key-a'))
+        key_b = repo.get_by_hash(hash_api_key('key-b'))
+        assert key_a is not None and key_a.active and key_a.email == 'a@example.com'
+        assert key_a.last_used == last_used and isinstance(key_a.created_at, datetime)
+        assert key_b is not None and not key_b.active
+        assert repo.get_active_hashes() == [hash_api_key('key-a')]
+    
+    # Already migrated: nothing to do
+    with engine.begin() as conn:
+        assert migrate_raw_keys_to_hashes(conn) is None
+
+
+def test_migration_keeps_newest_active_key_per_email(tmp_path):
+    engine = _legacy_engine(tmp_path, [
+        {'api_key': 'old', 'email': 'a@example.com', 'active': True, 'created_at': datetime(2024, 1, 1)},
+        {'api_key': 'new', 'email': 'a@example.com', 'active': True, 'created_at': datetime(2024, 2, 1)},
+    ])
+    
+    with engine.begin() as conn:
+        assert migrate_raw_keys_to_hashes(conn) == 2
+    
+    with Session(engine) as db:
+        assert ApiKeyRepository(db).get_active_hashes_by_email('a@example.com') == [hash_api_key('new')]
+
+
+def test_migration_resumes_from_legacy_table(tmp_path):
+    engine = _legacy_engine(tmp_path, [{'api_key': 'key-a', 'email': 'a@example.com', 'active': True}])
+    # State left by an attempt that failed after the rename and the new table's creation
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"ALTER TABLE api_keys RENAME TO {LEGACY_TABLE}")
+        conn.exec_driver_sql("DROP INDEX ix_api_keys_email")
+    ApiKey.__table__.create(engine)
+    
+    with engine.begin() as conn:
+        assert migrate_raw_keys_to_hashes(conn) == 1
+    
+    with Session(engine) as db:
+        assert ApiKeyRepository(db).get_by_hash(hash_api_key('key-a')).active